@@ -1,13 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Query
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
 import os
+import asyncio
+import hashlib
+import json
+import sqlite3
+import stat
+import cProfile
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import pandas as pd
-from io import BytesIO
-from datetime import datetime
+import csv
+import tempfile
+from io import BytesIO, StringIO
+from datetime import datetime, date
+from openpyxl import Workbook
 
 # Load environment variables
 load_dotenv()
@@ -15,15 +37,37 @@ load_dotenv()
 # Initialize FastAPI app
 app = FastAPI(title="Old Contracts API")
 
-# Initialize Supabase client
+# Compress large responses (/all_clients, big searches) for the clinic tablets
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Supabase client, created lazily once per worker process. A client created
+# before a fork would share its HTTP connections with the parent.
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
-supabase = create_client(supabase_url, supabase_key)
+_supabase: Optional[Client] = None
+_supabase_pid: Optional[int] = None
+_supabase_lock = threading.Lock()
+
+def get_supabase() -> Client:
+    global _supabase, _supabase_pid
+    if _supabase is None or _supabase_pid != os.getpid():
+        with _supabase_lock:
+            if _supabase is None or _supabase_pid != os.getpid():
+                _supabase = create_client(supabase_url, supabase_key)
+                _supabase_pid = os.getpid()
+    return _supabase
 
 # Initialize password from .env file
 DEMO_PASSWORD = os.getenv("DEMO_PASSWORD")
 
-class ClientSearch(BaseModel):
+class ClientFilters(BaseModel):
+    # Evaluated server-side on the typed, indexed columns of "clients"
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    unidade: Optional[str] = None
+    min_valor: Optional[float] = None
+
+class ClientSearch(ClientFilters):
     search_term: str
     password: str
 
@@ -40,41 +84,521 @@ class ImportResponse(BaseModel):
     rows_imported: int
     errors: List[str]
 
+# State shared by all worker processes on the host: the clients table
+# version and a cache of search results. Kept in a local SQLite file so
+# several uvicorn/gunicorn workers see the same version and cache. It is an
+# optimization only: if the file cannot be used, requests go to Supabase.
+# The cache holds client rows (CPF, names, phones), so it lives in a private
+# directory owned by the app user (not the shared temp directory) and the file
+# name is derived from the Supabase project, keeping deployments on the same
+# host (e.g. staging and prod) apart.
+SHARED_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "old_contracts")
+SHARED_STATE_PATH = os.getenv(
+    "SHARED_STATE_PATH",
+    os.path.join(
+        SHARED_STATE_DIR,
+        f"state-{hashlib.sha1((supabase_url or '').encode()).hexdigest()[:12]}.sqlite3"
+    )
+)
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+# One SQLite connection per thread and process
+_shared_state = threading.local()
+
+# Expired cache rows are swept at most once per TTL per process
+_last_cache_sweep = 0.0
+
+def check_private(path: str, info: os.stat_result):
+    # Refuse anything another local user could have created or can write to
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise PermissionError(f"{path} must be owned by this user and not accessible to others")
+
+def open_private_state_file():
+    state_dir = os.path.dirname(os.path.abspath(SHARED_STATE_PATH))
+    os.makedirs(state_dir, mode=0o700, exist_ok=True)
+    dir_info = os.lstat(state_dir)
+    if stat.S_ISLNK(dir_info.st_mode) or not stat.S_ISDIR(dir_info.st_mode):
+        raise PermissionError(f"{state_dir} must be a directory, not a symlink")
+    check_private(state_dir, dir_info)
+    
+    # Create the file owner-only before SQLite opens it, without following
+    # symlinks; the -wal and -shm files inherit its permissions
+    fd = os.open(SHARED_STATE_PATH, os.O_CREAT | os.O_RDWR | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    try:
+        file_info = os.fstat(fd)
+        if not stat.S_ISREG(file_info.st_mode):
+            raise PermissionError(f"{SHARED_STATE_PATH} must be a regular file")
+        check_private(SHARED_STATE_PATH, file_info)
+    finally:
+        os.close(fd)
+
+def shared_state() -> sqlite3.Connection:
+    connection = getattr(_shared_state, "connection", None)
+    if connection is None or _shared_state.pid != os.getpid():
+        open_private_state_file()
+        connection = sqlite3.connect(SHARED_STATE_PATH, timeout=1, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS profiles (id TEXT PRIMARY KEY, created_at TEXT, profile TEXT)"
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO state (key, value) VALUES ('table_version', ?)",
+            (datetime.utcnow().isoformat(),)
+        )
+        _shared_state.connection = connection
+        _shared_state.pid = os.getpid()
+    return connection
+
+# Version of the clients table, changed on every import. ETags are derived
+# from it so unchanged data can be answered with 304 Not Modified. None when
+# the shared state is unavailable: ETags are then skipped.
+def get_table_version() -> Optional[str]:
+    try:
+        row = shared_state().execute(
+            "SELECT value FROM state WHERE key = 'table_version'"
+        ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Shared state unavailable, skipping ETag: {str(e)}")
+        return None
+    return row[0] if row else None
+
+def bump_table_version():
+    try:
+        connection = shared_state()
+        connection.execute(
+            "UPDATE state SET value = ? WHERE key = 'table_version'", (datetime.utcnow().isoformat(),)
+        )
+        # Cached results are keyed by version; drop the now unreachable ones
+        connection.execute("DELETE FROM cache")
+    except (sqlite3.Error, OSError) as e:
+        print(f"Could not bump table version: {str(e)}")
+
+# Identifies a release (e.g. git commit or deploy timestamp). Optional: the
+# table version is reset once when it changes, not on every worker start.
+DEPLOYMENT_ID = os.getenv("DEPLOYMENT_ID")
+
+@app.on_event("startup")
+def reset_table_version_on_deploy():
+    # Data may have changed outside the API (migrations, edits in Supabase)
+    # between releases. Only the first worker of a new deployment resets;
+    # other, restarted or recycled workers keep the shared cache and ETags.
+    if not DEPLOYMENT_ID:
+        return
+    try:
+        cursor = shared_state().execute(
+            "INSERT INTO state (key, value) VALUES ('deployment_id', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value WHERE value != excluded.value",
+            (DEPLOYMENT_ID,)
+        )
+    except (sqlite3.Error, OSError) as e:
+        print(f"Could not check deployment id: {str(e)}")
+        return
+    if cursor.rowcount:
+        bump_table_version()
+
+def cache_get(key: str):
+    try:
+        row = shared_state().execute(
+            "SELECT value FROM cache WHERE key = ? AND created_at > ?",
+            (key, time.time() - SEARCH_CACHE_TTL)
+        ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Search cache read failed: {str(e)}")
+        return None
+    return json.loads(row[0]) if row else None
+
+def cache_set(key: str, value):
+    global _last_cache_sweep
+    try:
+        connection = shared_state()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time())
+        )
+        if time.time() - _last_cache_sweep > SEARCH_CACHE_TTL:
+            _last_cache_sweep = time.time()
+            connection.execute(
+                "DELETE FROM cache WHERE created_at <= ?", (time.time() - SEARCH_CACHE_TTL,)
+            )
+    except (sqlite3.Error, OSError) as e:
+        print(f"Search cache write failed: {str(e)}")
+
+def make_etag(version: Optional[str], *parts) -> Optional[str]:
+    if version is None:
+        return None
+    key = "|".join([version, *[str(part) for part in parts]])
+    # Weak: the same tag covers the plain and the gzip-encoded body
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+def is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not etag or not if_none_match:
+        return False
+    # Weak comparison, as required for If-None-Match
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates or "*" in candidates
+
+def etag_headers(etag: Optional[str]) -> dict:
+    return {"ETag": etag} if etag else {}
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+# Simple in-process counters exposed on /metrics (per worker process)
+metrics = {
+    "search_requests": 0,
+    "backend_queries": 0,
+    "coalesced_requests": 0,
+    "shared_cache_hits": 0,
+}
+
+# Backend queries currently running, keyed by normalized query. Concurrent
+# identical searches await the same task instead of hitting Supabase again.
+inflight_queries: Dict[str, asyncio.Future] = {}
+
+def normalize_search_term(search_term: str) -> str:
+    return " ".join(search_term.split()).lower()
+
+async def coalesced(key: str, func, *args):
+    task = inflight_queries.get(key)
+    if task is not None:
+        metrics["coalesced_requests"] += 1
+    else:
+        metrics["backend_queries"] += 1
+        task = asyncio.ensure_future(run_in_threadpool(func, *args))
+        inflight_queries[key] = task
+        task.add_done_callback(lambda _: inflight_queries.pop(key, None))
+    # Shield so one cancelled caller does not cancel the query for the others
+    return await asyncio.shield(task)
+
+# On-demand profiling: send "X-Profile: <password>" on a request, or set
+# PROFILE_SAMPLE_RATE (0..1) to profile a fraction of requests.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILED_PATHS = {"/search_client", "/import_excel", "/all_clients"}
+
+# Last captured profiles, served by /profiles. Kept in the shared state so
+# any worker can serve them; this deque is only used if it is unavailable.
+PROFILES_KEPT = 20
+profiles = deque(maxlen=PROFILES_KEPT)
+
+def store_profile(profile: dict):
+    try:
+        connection = shared_state()
+        connection.execute(
+            "INSERT INTO profiles (id, created_at, profile) VALUES (?, ?, ?)",
+            (profile["id"], profile["created_at"], json.dumps(profile))
+        )
+        connection.execute(
+            "DELETE FROM profiles WHERE id NOT IN "
+            "(SELECT id FROM profiles ORDER BY created_at DESC LIMIT ?)",
+            (PROFILES_KEPT,)
+        )
+    except (sqlite3.Error, OSError) as e:
+        print(f"Storing profile in this worker only: {str(e)}")
+        profiles.append(profile)
+
+def load_profiles() -> list:
+    # Newest first, from all workers
+    try:
+        rows = shared_state().execute(
+            "SELECT profile FROM profiles ORDER BY created_at DESC"
+        ).fetchall()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Shared profiles unavailable: {str(e)}")
+        rows = []
+    return [json.loads(row[0]) for row in rows] + list(reversed(profiles))
+
+# Phase durations (seconds) of the current profiled request
+request_phases: ContextVar[Optional[dict]] = ContextVar("request_phases", default=None)
+
+# cProfile of the current profiled request, enabled only inside its phases
+request_profiler: ContextVar[Optional[cProfile.Profile]] = ContextVar("request_profiler", default=None)
+
+# cProfile allows a single active profiler, so concurrent profiled
+# requests only record phase timings
+profiler_lock = threading.Lock()
+
+@contextmanager
+def phase(name: str, profiled: bool = True):
+    # The profiler runs on the event loop thread, so it is only enabled for
+    # phases without an await: otherwise other requests' coroutines would be
+    # counted too. Awaited phases must pass profiled=False.
+    phases = request_phases.get()
+    if phases is None:
+        yield
+        return
+    profiler = request_profiler.get() if profiled else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+class ProfileRequestsMiddleware:
+    # Plain ASGI middleware: requests outside PROFILED_PATHS (e.g. the
+    # streamed /export) go straight to the app without any wrapping.
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in PROFILED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        # Timings are only returned to callers who sent the password in
+        # X-Profile; sampled requests are just stored
+        profile_header = Headers(scope=scope).get("x-profile")
+        requested = profile_header is not None and profile_header == DEMO_PASSWORD
+        if not requested and (profile_header is not None or random.random() >= PROFILE_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+        
+        phases = {}
+        profiler = cProfile.Profile() if profiler_lock.acquire(blocking=False) else None
+        phases_token = request_phases.set(phases)
+        profiler_token = request_profiler.set(profiler)
+        start = time.perf_counter()
+        
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                profile_id = uuid.uuid4().hex[:12]
+                # Failed requests (bad password, validation errors) and 304s
+                # carry no useful timings and are not kept
+                if 200 <= message["status"] < 300:
+                    await run_in_threadpool(
+                        store_profile, build_profile(profile_id, scope["path"], total, phases, profiler)
+                    )
+                if requested:
+                    server_timing = [f"{name};dur={duration * 1000:.2f}" for name, duration in phases.items()]
+                    server_timing.append(f"total;dur={total * 1000:.2f}")
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", ", ".join(server_timing))
+                    headers.append("X-Profile-Id", profile_id)
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            if profiler:
+                profiler_lock.release()
+            request_profiler.reset(profiler_token)
+            request_phases.reset(phases_token)
+
+app.add_middleware(ProfileRequestsMiddleware)
+
+def build_profile(profile_id: str, path: str, total: float, phases: dict,
+                  profiler: Optional[cProfile.Profile]) -> dict:
+    stats_text = ""
+    if profiler and profiler.getstats():
+        stream = StringIO()
+        stream.write(
+            "Call-stack profile of the handler's synchronous phases only. Awaited\n"
+            "backend queries run in the threadpool and only appear as phase time.\n\n"
+        )
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(40)
+        stats_text = stream.getvalue()
+    
+    return {
+        "id": profile_id,
+        "path": path,
+        "created_at": datetime.utcnow().isoformat(),
+        "total_ms": round(total * 1000, 2),
+        "phases_ms": {name: round(duration * 1000, 2) for name, duration in phases.items()},
+        "stats": stats_text,
+    }
+
+def apply_filters(query, filters: ClientFilters):
+    if filters.date_from:
+        query = query.gte("data_venda", filters.date_from.isoformat())
+    if filters.date_to:
+        query = query.lte("data_venda", filters.date_to.isoformat())
+    if filters.unidade:
+        query = query.eq("unidade", filters.unidade)
+    if filters.min_valor is not None:
+        query = query.gte("valor_liquido", filters.min_valor)
+    return query
+
+def filters_key(filters: ClientFilters) -> str:
+    return f"{filters.date_from}|{filters.date_to}|{filters.unidade}|{filters.min_valor}"
+
+def query_clients(search_term: str, filters: ClientFilters) -> list:
+    # Search by CPF (exact match) or name (case-insensitive contains)
+    result = apply_filters(get_supabase().table("clients").select("*").filter(
+        "cpf", "eq", search_term
+    ), filters).execute()
+    
+    if not result.data:
+        # If no results found by CPF, try searching by name
+        result = apply_filters(get_supabase().table("clients").select("*").filter(
+            "name", "ilike", f"%{search_term}%"
+        ), filters).execute()
+    
+    return result.data or []
+
+def cached_query_clients(cache_key: Optional[str], search_term: str, filters: ClientFilters) -> list:
+    # Results computed by any worker are reused until the next import;
+    # without a table version (shared state unavailable) the cache is skipped
+    if cache_key is None:
+        return query_clients(search_term, filters)
+    clients = cache_get(cache_key)
+    if clients is not None:
+        metrics["shared_cache_hits"] += 1
+        return clients
+    clients = query_clients(search_term, filters)
+    cache_set(cache_key, clients)
+    return clients
+
+# Rows fetched from Supabase per page when exporting
+EXPORT_PAGE_SIZE = 1000
+
+# Export columns: header and key in the client row / contract_details
+EXPORT_COLUMNS = [
+    ("CPF", "cpf"),
+    ("Cliente", "name"),
+    ("Status", "status"),
+    ("ID", "id"),
+    ("Data Venda", "data_venda"),
+    ("Unidade", "unidade"),
+    ("Procedimento / Produto", "procedimento_produto"),
+    ("Quantidade", "quantidade"),
+    ("Valor Líquido", "valor_liquido"),
+    ("Valor Tabela Item", "valor_tabela_item"),
+    ("% Desconto Item", "desconto_item_percentual"),
+    ("Valor Desconto Item", "valor_desconto_item"),
+    ("Valor Líquido Item", "valor_liquido_item"),
+    ("Mês Venda", "mes_venda"),
+    ("Ano Venda", "ano_venda"),
+    ("Telefone", "telefone"),
+]
+
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+
+def export_row(client: dict) -> list:
+    details = client.get("contract_details") or {}
+    row = []
+    for _, key in EXPORT_COLUMNS:
+        value = client.get(key, "") if key in ("cpf", "name", "status") else details.get(key, "")
+        row.append("" if value is None else value)
+    return row
+
+def iter_export_clients(search_term: Optional[str], filters: ClientFilters):
+    # Same semantics as /search_client: exact CPF if it exists, else name contains
+    term_filter = None
+    if search_term:
+        cpf_match = get_supabase().table("clients").select("cpf").filter(
+            "cpf", "eq", search_term
+        ).limit(1).execute()
+        if cpf_match.data:
+            term_filter = ("cpf", "eq", search_term)
+        else:
+            term_filter = ("name", "ilike", f"%{search_term}%")
+    
+    offset = 0
+    while True:
+        query = get_supabase().table("clients").select("*")
+        if term_filter:
+            query = query.filter(*term_filter)
+        query = apply_filters(query, filters)
+        try:
+            page = query.order("id").range(offset, offset + EXPORT_PAGE_SIZE - 1).execute()
+        except Exception as e:
+            # Headers are already sent: re-raise so the download is aborted
+            # instead of ending as a truncated but successful file
+            print(f"Export failed at row {offset}: {str(e)}")
+            raise
+        
+        # The project's max-rows setting may cap pages below EXPORT_PAGE_SIZE,
+        # so only an empty page marks the end
+        if not page.data:
+            break
+        yield from page.data
+        offset += len(page.data)
+
+def stream_csv(clients):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens accented headers correctly
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_HEADERS)
+    for client in clients:
+        writer.writerow(export_row(client))
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def stream_xlsx(clients):
+    # Write-only workbook keeps rows out of memory; the zip container can
+    # only be emitted once complete, so it is spooled to disk and streamed.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Contratos")
+    sheet.append(EXPORT_HEADERS)
+    for client in clients:
+        sheet.append(export_row(client))
+    
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        workbook.save(spool)
+        spool.seek(0)
+        while chunk := spool.read(64 * 1024):
+            yield chunk
+
 @app.post("/search_client", response_model=List[ClientResponse])
-async def search_client(client_search: ClientSearch):
+async def search_client(client_search: ClientSearch, request: Request):
     if client_search.password != DEMO_PASSWORD:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid password"
         )
     
+    metrics["search_requests"] += 1
+    search_term = normalize_search_term(client_search.search_term)
+    filters = ClientFilters(
+        date_from=client_search.date_from,
+        date_to=client_search.date_to,
+        unidade=client_search.unidade,
+        min_valor=client_search.min_valor
+    )
+    
+    version = await run_in_threadpool(get_table_version)
+    etag = make_etag(version, "search_client", search_term, filters_key(filters))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    
     try:
-        # Search by CPF (exact match) or name (case-insensitive contains)
-        response = supabase.table("clients").select("*").filter(
-            "cpf", "eq", client_search.search_term
-        ).execute()
-        
-        if not response.data:
-            # If no results found by CPF, try searching by name
-            response = supabase.table("clients").select("*").filter(
-                "name", "ilike", f"%{client_search.search_term}%"
-            ).execute()
-        
-        if not response.data:
-            return []
+        with phase("backend_query", profiled=False):
+            query_key = f"search_client|{version}|{search_term}|{filters_key(filters)}"
+            cache_key = query_key if version else None
+            clients = await coalesced(
+                query_key, cached_query_clients, cache_key, search_term, filters
+            )
         
         # Return all matches
-        return [
-            ClientResponse(
-                cpf=client["cpf"],
-                name=client["name"],
-                contract_details=client["contract_details"],
-                status=client["status"],
-                created_at=client["created_at"],
-                updated_at=client["updated_at"]
-            )
-            for client in response.data
-        ]
+        with phase("model_build"):
+            matches = [
+                ClientResponse(
+                    cpf=client["cpf"],
+                    name=client["name"],
+                    contract_details=client["contract_details"],
+                    status=client["status"],
+                    created_at=client["created_at"],
+                    updated_at=client["updated_at"]
+                )
+                for client in clients
+            ]
+        
+        with phase("serialization"):
+            return JSONResponse(content=jsonable_encoder(matches), headers=etag_headers(etag))
         
     except Exception as e:
         raise HTTPException(
@@ -82,6 +606,34 @@ async def search_client(client_search: ClientSearch):
             detail=str(e)
         )
 
+def parse_sale_date(value) -> Optional[str]:
+    # Missing cells arrive as 0 after fillna
+    if isinstance(value, (int, float)):
+        return None
+    if isinstance(value, date):
+        return pd.Timestamp(value).date().isoformat()
+    text = str(value).strip()
+    if not text:
+        return None
+    # ISO text ("2023-01-05", str(Timestamp)) first: dayfirst would swap its
+    # day and month; Brazilian dd/mm/yyyy text is the fallback
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        sale_date = pd.to_datetime(text, errors="coerce", dayfirst=True)
+    return None if pd.isna(sale_date) else sale_date.date().isoformat()
+
+def parse_text(value) -> Optional[str]:
+    text = str(value).strip()
+    return None if text in ("", "0") else text
+
+def parse_int(value) -> Optional[int]:
+    try:
+        number = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return number or None
+
 @app.post("/import_excel", response_model=ImportResponse)
 async def import_excel(file: UploadFile = File(...), password: str = Query(None)):
     if password != DEMO_PASSWORD:
@@ -95,14 +647,7 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
         content = await file.read()
         print(f"File size: {len(content)} bytes")
         
-        # Save to a temporary file first
-        temp_file = "temp_upload.xlsx"
-        
         try:
-            # Save the original file
-            with open(temp_file, "wb") as f:
-                f.write(content)
-            
             # Read Excel file with specific column names
             expected_columns = [
                 'ID', 'Data Venda', 'Unidade', 'Cliente', 'Valor Líquido',
@@ -112,7 +657,9 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
             ]
             
             print("Reading Excel file...")
-            df = pd.read_excel(temp_file)
+            with phase("parse_excel"):
+                # Parsed from memory: no scratch file shared between workers
+                df = pd.read_excel(BytesIO(content))
             
             # Verify and fix column names if needed
             current_columns = df.columns.tolist()
@@ -135,6 +682,12 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
                         'cpf': str(row.get('CPF', '')).strip() if pd.notna(row.get('CPF', '')) else '',
                         'name': str(row.get('Cliente', '')).strip() if pd.notna(row.get('Cliente', '')) else '',
                         'status': str(row.get('Status', '')).strip() if pd.notna(row.get('Status', '')) else '',
+                        # Typed, indexed columns used by the server-side filters
+                        'data_venda': parse_sale_date(row.get('Data Venda', 0)),
+                        'unidade': parse_text(row.get('Unidade', 0)),
+                        'ano_venda': parse_int(row.get('Ano Venda', 0)),
+                        'mes_venda': parse_int(row.get('Mês Venda', 0)),
+                        'valor_liquido': float(row.get('Valor Líquido', 0)),
                         'contract_details': {
                             'id': str(row.get('ID', '')),
                             'data_venda': str(row.get('Data Venda', '')),
@@ -154,7 +707,8 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
                     }
                     
                     # Insert into Supabase
-                    supabase.table('clients').insert(data).execute()
+                    with phase("backend_query"):
+                        get_supabase().table('clients').insert(data).execute()
                     success_count += 1
                     print(f"Successfully imported row {index + 2}")
                     
@@ -163,11 +717,15 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
                     print(error_msg)
                     row_errors.append(error_msg)
             
-            return ImportResponse(
-                success=True,
-                rows_imported=success_count,
-                errors=row_errors
-            )
+            if success_count:
+                bump_table_version()
+            
+            with phase("model_build"):
+                return ImportResponse(
+                    success=True,
+                    rows_imported=success_count,
+                    errors=row_errors
+                )
             
         except Exception as e:
             print(f"Error processing file: {str(e)}")
@@ -175,10 +733,6 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Error processing file: {str(e)}"
             )
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
             
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -189,22 +743,133 @@ async def import_excel(file: UploadFile = File(...), password: str = Query(None)
         )
 
 @app.get("/all_clients")
-async def get_all_clients(password: str):
+async def get_all_clients(
+    password: str,
+    request: Request,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    unidade: Optional[str] = None,
+    min_valor: Optional[float] = None,
+):
     if password != DEMO_PASSWORD:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid password"
         )
     
+    filters = ClientFilters(date_from=date_from, date_to=date_to, unidade=unidade, min_valor=min_valor)
+    version = await run_in_threadpool(get_table_version)
+    etag = make_etag(version, "all_clients", filters_key(filters))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    
     try:
-        response = supabase.table("clients").select("*").execute()
-        return response.data
+        with phase("backend_query", profiled=False):
+            query = apply_filters(get_supabase().table("clients").select("*"), filters)
+            result = await run_in_threadpool(query.execute)
+        with phase("serialization"):
+            return JSONResponse(content=result.data, headers=etag_headers(etag))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
+@app.get("/export")
+async def export_clients(
+    password: str,
+    format: str = "csv",
+    search_term: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    unidade: Optional[str] = None,
+    min_valor: Optional[float] = None,
+):
+    if password != DEMO_PASSWORD:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid password"
+        )
+    
+    if format not in ("csv", "xlsx"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid format, use csv or xlsx"
+        )
+    
+    if search_term:
+        search_term = normalize_search_term(search_term)
+    filters = ClientFilters(date_from=date_from, date_to=date_to, unidade=unidade, min_valor=min_valor)
+    clients = iter_export_clients(search_term, filters)
+    filename = f"contratos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    
+    if format == "xlsx":
+        body = stream_xlsx(clients)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = stream_csv(clients)
+        media_type = "text/csv; charset=utf-8"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/invalidate")
+async def invalidate_cache(password: str):
+    # For changes made outside /import_excel, e.g. a migration or edits in Supabase
+    if password != DEMO_PASSWORD:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid password"
+        )
+    
+    await run_in_threadpool(bump_table_version)
+    return {"table_version": await run_in_threadpool(get_table_version)}
+
+@app.get("/metrics")
+async def get_metrics(password: str):
+    if password != DEMO_PASSWORD:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid password"
+        )
+    
+    return {**metrics, "inflight_queries": len(inflight_queries), "worker_pid": os.getpid()}
+
+@app.get("/profiles")
+async def list_profiles(password: str):
+    if password != DEMO_PASSWORD:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid password"
+        )
+    
+    return [
+        {key: value for key, value in profile.items() if key != "stats"}
+        for profile in await run_in_threadpool(load_profiles)
+    ]
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, password: str):
+    if password != DEMO_PASSWORD:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid password"
+        )
+    
+    for profile in await run_in_threadpool(load_profiles):
+        if profile["id"] == profile_id:
+            phases = ", ".join(f"{name}={ms}ms" for name, ms in profile["phases_ms"].items())
+            header = f"{profile['path']} total={profile['total_ms']}ms {phases}\n\n"
+            return header + (profile["stats"] or "(call-stack profile skipped: another profile was running)\n")
+    
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Profile not found"
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -0,0 +1,34 @@
+-- Typed, indexed columns for server-side filtering on "clients".
+-- The values were previously only available as strings inside contract_details.
+
+alter table clients
+    add column if not exists data_venda date,
+    add column if not exists unidade text,
+    add column if not exists ano_venda integer,
+    add column if not exists mes_venda integer,
+    add column if not exists valor_liquido numeric(12, 2);
+
+-- Backfill rows imported before these columns existed.
+-- data_venda was stored as str(Timestamp), e.g. "2023-01-05 00:00:00",
+-- and missing cells as "0"; years/months as "2023" or "2023.0".
+update clients set
+    data_venda = case
+        when contract_details->>'data_venda' ~ '^\d{4}-\d{2}-\d{2}'
+        then left(contract_details->>'data_venda', 10)::date
+    end,
+    unidade = nullif(nullif(trim(contract_details->>'unidade'), ''), '0'),
+    ano_venda = case
+        when contract_details->>'ano_venda' ~ '^\d+(\.0+)?$'
+        then nullif(split_part(contract_details->>'ano_venda', '.', 1)::integer, 0)
+    end,
+    mes_venda = case
+        when contract_details->>'mes_venda' ~ '^\d+(\.0+)?$'
+        then nullif(split_part(contract_details->>'mes_venda', '.', 1)::integer, 0)
+    end,
+    valor_liquido = (contract_details->>'valor_liquido')::numeric
+where data_venda is null and contract_details is not null;
+
+create index if not exists clients_data_venda_idx on clients (data_venda);
+create index if not exists clients_unidade_data_venda_idx on clients (unidade, data_venda);
+create index if not exists clients_ano_mes_venda_idx on clients (ano_venda, mes_venda);
+create index if not exists clients_valor_liquido_idx on clients (valor_liquido);
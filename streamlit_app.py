@@ -40,15 +40,34 @@ st.markdown("""
 # API endpoint
 API_URL = st.secrets["api_url"]
 
+# Responses cached per session by ETag, so unchanged data is answered with 304
+if "etag_cache" not in st.session_state:
+    st.session_state.etag_cache = {}
+
+def conditional_headers(cache_key: str):
+    cached = st.session_state.etag_cache.get(cache_key)
+    return {"If-None-Match": cached["etag"]} if cached else {}
+
+def cached_json(cache_key: str, response):
+    if response.status_code == 304:
+        return st.session_state.etag_cache[cache_key]["data"]
+    data = response.json()
+    etag = response.headers.get("ETag")
+    if etag:
+        st.session_state.etag_cache[cache_key] = {"etag": etag, "data": data}
+    return data
+
 def search_client(search_term: str, password: str):
     try:
+        cache_key = f"search_client:{search_term}"
         response = requests.post(
             f"{API_URL}/search_client",
-            json={"search_term": search_term, "password": password}
+            json={"search_term": search_term, "password": password},
+            headers=conditional_headers(cache_key)
         )
         
-        if response.status_code == 200:
-            return response.json()
+        if response.status_code in (200, 304):
+            return cached_json(cache_key, response)
         elif response.status_code == 401:
             st.error("Senha inválida!")
         elif response.status_code == 404:
@@ -90,13 +109,15 @@ def import_excel(file, password: str):
 
 def get_all_clients(password: str):
     try:
+        cache_key = "all_clients"
         response = requests.get(
             f"{API_URL}/all_clients",
-            params={"password": password}
+            params={"password": password},
+            headers=conditional_headers(cache_key)
         )
         
-        if response.status_code == 200:
-            return response.json()
+        if response.status_code in (200, 304):
+            return cached_json(cache_key, response)
         elif response.status_code == 401:
             st.error("Invalid password!")
         else:
@@ -106,6 +127,27 @@ def get_all_clients(password: str):
         st.error(f"Error connecting to the server: {str(e)}")
         return None
 
+EXPORT_MIME_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def export_clients(search_term: str, password: str, export_format: str = "csv"):
+    try:
+        response = requests.get(
+            f"{API_URL}/export",
+            params={"password": password, "search_term": search_term, "format": export_format}
+        )
+        
+        if response.status_code == 200:
+            return response.content
+        else:
+            st.error(f"Erro ao exportar: {response.json()['detail']}")
+        return None
+    except Exception as e:
+        st.error(f"Erro de conexão com o servidor: {str(e)}")
+        return None
+
 # Sidebar for navigation
 st.sidebar.title("💎 Pró-Corpo")
 page = "Search Clients"  # Fixed to search only
@@ -213,3 +255,29 @@ if st.button("Buscar 🔍"):
                     'background-color': '#FFF5F7',
                     'color': '#702459'
                 }), use_container_width=True)
+            
+            # Remember the search so the export buttons survive reruns; a
+            # search without results must not keep exporting the previous term
+            st.session_state.last_search = search_term if results else None
+
+# Export is only requested from the API when one of these buttons is clicked
+if st.session_state.get("last_search") and password:
+    st.markdown("#### 📥 Exportar resultados")
+    st.caption(f"Busca: {st.session_state.last_search}")
+    col_csv, col_xlsx = st.columns(2)
+    export_format = None
+    if col_csv.button("Exportar CSV"):
+        export_format = "csv"
+    if col_xlsx.button("Exportar XLSX"):
+        export_format = "xlsx"
+    
+    if export_format:
+        with st.spinner("Gerando arquivo... 💫"):
+            export_data = export_clients(st.session_state.last_search, password, export_format)
+        if export_data:
+            st.download_button(
+                f"Baixar {export_format.upper()} 📥",
+                data=export_data,
+                file_name=f"contratos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+                mime=EXPORT_MIME_TYPES[export_format]
+            )
@@ -0,0 +1,39 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+from app.api.main import parse_int, parse_sale_date
+
+
+def test_parse_sale_date_timestamp():
+    assert parse_sale_date(pd.Timestamp("2023-01-05")) == "2023-01-05"
+    assert parse_sale_date(datetime(2023, 1, 5, 10, 30)) == "2023-01-05"
+    assert parse_sale_date(date(2023, 1, 5)) == "2023-01-05"
+
+
+def test_parse_sale_date_iso_text_keeps_month():
+    assert parse_sale_date("2023-01-05") == "2023-01-05"
+    assert parse_sale_date("2023-01-05 00:00:00") == "2023-01-05"
+    assert parse_sale_date(" 2023-12-01 ") == "2023-12-01"
+
+
+def test_parse_sale_date_day_first_text():
+    assert parse_sale_date("05/01/2023") == "2023-01-05"
+    assert parse_sale_date("25/12/2022") == "2022-12-25"
+
+
+def test_parse_sale_date_missing():
+    assert parse_sale_date(0) is None
+    assert parse_sale_date(0.0) is None
+    assert parse_sale_date("") is None
+    assert parse_sale_date("not a date") is None
+
+
+def test_parse_int():
+    assert parse_int(2023) == 2023
+    assert parse_int("2023") == 2023
+    assert parse_int("2023.0") == 2023
+    assert parse_int(5.0) == 5
+    assert parse_int(0) is None
+    assert parse_int("") is None
+    assert parse_int("janeiro") is None